@@ -1,58 +1,146 @@
 import streamlit as st
+import io
 import pandas as pd
+import numpy as np
+import numpy_groupies as npg
 import re
+import operator
 import plotly.express as px
+import plotly.graph_objects as go
+
+try:
+    import numba
+except ImportError:  # optional: Direct Revenue falls back to plain NumPy
+    numba = None
+
+_COND_RE = re.compile(r"^\s*(>=|<=|>|<|==|=)\s*(\d+(?:\.\d+)?)\s*$")
+OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le, "==": operator.eq, "=": operator.eq}
+
+if numba is not None:
+    # Serial on purpose: Streamlit runs each session in its own thread, and
+    # numba's parallel threading layers are not safe to enter from several threads
+    @numba.njit(cache=True)
+    def _direct_revenue_kernel(direct, indirect, rev, out):
+        for i in range(direct.shape[0]):
+            total = direct[i] + indirect[i]
+            out[i] = (direct[i] / total) * rev[i] if total > 0 else 0.0
 
 st.set_page_config(page_title="Campaign Dashboard", layout="wide")
 st.title("📊 Campaign Metrics Dashboard")
 
+
+def unique_dates(dates: pd.Series) -> list[str]:
+    return sorted(dates.dropna().astype(str).unique().tolist())
+
+
+@st.cache_data
+def load_df(file_bytes: bytes, name: str) -> tuple[pd.DataFrame, bool, list[str]]:
+    # Step 2: Read File
+    buffer = io.BytesIO(file_bytes)
+    if name.endswith(".csv"):
+        df = pd.read_csv(buffer, engine="pyarrow")
+    else:
+        df = pd.read_excel(buffer, engine="calamine")
+    df["Sku Id"] = df["Sku Id"].astype("category")
+
+    # Step 3: ADDSPEND check
+    addspend_derived = "ADDSPEND" not in df.columns
+    if addspend_derived:
+        has_roi = df["ROI"].notna() & (df["ROI"] != 0)
+        df["ADDSPEND"] = 0.0
+        df.loc[has_roi, "ADDSPEND"] = df.loc[has_roi, "Total Revenue (Rs.)"] / df.loc[has_roi, "ROI"]
+
+    # Narrow the count columns; the SKU sums below still accumulate in 64-bit
+    for col in ["Views", "Clicks", "Direct Units Sold", "Indirect Units Sold"]:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+
+    # ✅ Step 4: Row-level Direct Revenue Calculation
+    # Units are taken as float64 so the downcast columns cannot overflow when summed
+    direct_units = df["Direct Units Sold"].to_numpy(dtype=float)
+    indirect_units = df["Indirect Units Sold"].to_numpy(dtype=float)
+    revenue = df["Total Revenue (Rs.)"].to_numpy(dtype=float)
+    if numba is not None:
+        direct_revenue = np.empty(len(df))
+        _direct_revenue_kernel(direct_units, indirect_units, revenue, direct_revenue)
+    else:
+        total_units = direct_units + indirect_units
+        direct_revenue = np.divide(
+            direct_units, total_units,
+            out=np.zeros(len(df)), where=total_units > 0
+        )
+        direct_revenue *= revenue
+    df["Direct Revenue"] = direct_revenue
+    # Sidebar date options are built here so reruns don't redo the str conversion
+    date_options = unique_dates(df["Date"]) if "Date" in df.columns else []
+    return df, addspend_derived, date_options
+
+
+@st.cache_data
+def compute_agg(df: pd.DataFrame) -> pd.DataFrame:
+    # ✅ Step 5: Grouped Aggregation (after row-level direct revenue calc)
+    sum_columns = [
+        "ADDSPEND", "Views", "Clicks", "Direct Units Sold",
+        "Indirect Units Sold", "Total Revenue (Rs.)", "Direct Revenue"
+    ]
+    # Sum each column over the SKU category codes; rows without a SKU (code -1) are dropped
+    sku = df["Sku Id"]
+    codes = sku.cat.codes.to_numpy()
+    has_sku = codes >= 0
+    codes = codes[has_sku]
+    n_skus = len(sku.cat.categories)
+    agg_df = pd.DataFrame({"Sku Id": pd.Categorical.from_codes(np.arange(n_skus), dtype=sku.dtype)})
+    for col in sum_columns:
+        values = df[col].to_numpy()[has_sku]
+        # Accumulate in 64-bit so downcast columns cannot overflow
+        sum_dtype = np.result_type(values.dtype, np.int64)
+        if codes.size == 0:
+            # npg rejects an empty group index (header-only file or no SKUs at all)
+            agg_df[col] = np.zeros(n_skus, dtype=sum_dtype)
+        else:
+            agg_df[col] = npg.aggregate(codes, values, func="nansum", size=n_skus, dtype=sum_dtype)
+
+    agg_df["Total Units Sold"] = agg_df["Direct Units Sold"] + agg_df["Indirect Units Sold"]
+    views = agg_df["Views"].to_numpy(dtype=float)
+    clicks = agg_df["Clicks"].to_numpy(dtype=float)
+    ctr = np.zeros(len(agg_df))
+    np.divide(clicks, views, out=ctr, where=views != 0)
+    ctr *= 100
+    agg_df["CTR"] = ctr
+
+    # A zero denominator divides by 1, i.e. leaves the numerator as-is
+    total_units = agg_df["Total Units Sold"].to_numpy(dtype=float)
+    agg_df["Conversion Rate per SKU"] = np.divide(
+        total_units, clicks, out=total_units.copy(), where=clicks != 0
+    )
+    direct_units = agg_df["Direct Units Sold"].to_numpy(dtype=float)
+    adjusted_clicks = clicks - agg_df["Indirect Units Sold"].to_numpy(dtype=float)
+    agg_df["Conversion Rate Direct Adjusted"] = np.divide(
+        direct_units, adjusted_clicks, out=direct_units.copy(), where=adjusted_clicks != 0
+    )
+    addspend = agg_df["ADDSPEND"].to_numpy(dtype=float)
+    agg_df["ROI_Direct"] = np.divide(
+        agg_df["Direct Revenue"].to_numpy(dtype=float), addspend,
+        out=np.zeros(len(agg_df)), where=addspend > 0
+    )
+    return agg_df
+
+
 # Step 1: Upload File
 uploaded_file = st.file_uploader("📂 Upload your Campaign file (Excel or CSV)", type=["xlsx", "csv"])
 
 if uploaded_file:
     try:
-        # Step 2: Read File
-        if uploaded_file.name.endswith(".csv"):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
-
-        # Step 3: ADDSPEND check
-        if "ADDSPEND" not in df.columns:
+        # Steps 2-5 run once per upload; filter edits rerun the script but reuse
+        # the frames kept in session state instead of re-hashing the file
+        if st.session_state.get("upload_id") != uploaded_file.file_id:
+            df, addspend_derived, date_options = load_df(uploaded_file.getvalue(), uploaded_file.name)
+            upload = (df, compute_agg(df), addspend_derived, date_options)
+            # Record the id last so a failed load is retried rather than showing the previous file
+            st.session_state.upload = upload
+            st.session_state.upload_id = uploaded_file.file_id
+        df, agg_df, addspend_derived, date_options = st.session_state.upload
+        if addspend_derived:
             st.warning("📉 'ADDSPEND' column missing — calculating using Revenue / ROI")
-            df["ADDSPEND"] = df.apply(
-                lambda row: (row["Total Revenue (Rs.)"] / row["ROI"])
-                if pd.notnull(row["ROI"]) and row["ROI"] != 0 else 0,
-                axis=1
-            )
-
-        # ✅ Step 4: Row-level Direct Revenue Calculation
-        df["Total Units Sold"] = df["Direct Units Sold"] + df["Indirect Units Sold"]
-        df["Direct Revenue"] = df.apply(
-            lambda row: (row["Direct Units Sold"] / row["Total Units Sold"]) * row["Total Revenue (Rs.)"]
-            if row["Total Units Sold"] > 0 else 0, axis=1
-        )
-
-        # ✅ Step 5: Grouped Aggregation (after row-level direct revenue calc)
-        agg_df = df.groupby("Sku Id").agg({
-            "ADDSPEND": "sum",
-            "Views": "sum",
-            "Clicks": "sum",
-            "Direct Units Sold": "sum",
-            "Indirect Units Sold": "sum",
-            "Total Revenue (Rs.)": "sum",
-            "Direct Revenue": "sum"
-        }).reset_index()
-
-        agg_df["Total Units Sold"] = agg_df["Direct Units Sold"] + agg_df["Indirect Units Sold"]
-        agg_df["CTR"] = (agg_df["Clicks"] / agg_df["Views"]).replace([float('inf'), -float('inf')], 0) * 100
-        agg_df["Conversion Rate per SKU"] = agg_df["Total Units Sold"] / agg_df["Clicks"].replace(0, 1)
-        agg_df["Conversion Rate Direct Adjusted"] = agg_df["Direct Units Sold"] / (
-            agg_df["Clicks"] - agg_df["Indirect Units Sold"]).replace(0, 1)
-        agg_df["ROI_Direct"] = agg_df.apply(
-            lambda row: row["Direct Revenue"] / row["ADDSPEND"] if row["ADDSPEND"] > 0 else 0,
-            axis=1
-        )
 
         # Step 6: Sidebar Filters
         st.sidebar.header("🔎 Filter Conditions")
@@ -63,8 +151,7 @@ if uploaded_file:
         filter_revenue = st.sidebar.text_input("Total Revenue (Rs.) (e.g. >= 10000)")
 
         if "Date" in df.columns:
-            unique_dates = sorted(df["Date"].dropna().astype(str).unique().tolist())
-            selected_date = st.sidebar.selectbox("📅 Filter by Date", options=["All"] + unique_dates)
+            selected_date = st.sidebar.selectbox("📅 Filter by Date", options=["All"] + date_options)
         else:
             selected_date = "All"
 
@@ -72,41 +159,51 @@ if uploaded_file:
         selected_skus = st.sidebar.multiselect("🔢 Filter by Sku Id", options=sorted(sku_list))
 
         # Step 7: Apply Filters
-        filtered_df = agg_df.copy()
-
-        def apply_condition(df, column, condition):
-            match = re.match(r"^\s*(>=|<=|>|<|==|=)\s*(\d+(\.\d+)?)\s*$", condition)
+        def build_mask(values, column, condition):
+            if not condition.strip():
+                return np.ones(len(values), dtype=bool)
+            match = _COND_RE.match(condition)
             if match:
                 op, val = match.group(1), float(match.group(2))
-                return df.query(f"`{column}` {op} {val}")
+                return OPS[op](values, val)
             else:
                 st.warning(f"⚠️ Invalid filter for {column}. Use like '> 100'")
-                return df
+                return np.ones(len(values), dtype=bool)
 
+        # Every filter narrows one boolean mask; agg_df is sliced once at the end
+        mask = np.ones(len(agg_df), dtype=bool)
         if filter_clicks:
-            filtered_df = apply_condition(filtered_df, "Clicks", filter_clicks)
+            mask &= build_mask(agg_df["Clicks"].to_numpy(), "Clicks", filter_clicks)
         if filter_ctr:
-            filtered_df = apply_condition(filtered_df, "CTR", filter_ctr)
+            mask &= build_mask(agg_df["CTR"].to_numpy(), "CTR", filter_ctr)
         if filter_cr_direct:
-            filtered_df["Conversion Rate Direct Adjusted"] *= 100
-            filtered_df = apply_condition(filtered_df, "Conversion Rate Direct Adjusted", filter_cr_direct)
+            mask &= build_mask(
+                agg_df["Conversion Rate Direct Adjusted"].to_numpy() * 100,
+                "Conversion Rate Direct Adjusted", filter_cr_direct
+            )
         if filter_addspend:
-            filtered_df = apply_condition(filtered_df, "ADDSPEND", filter_addspend)
+            mask &= build_mask(agg_df["ADDSPEND"].to_numpy(), "ADDSPEND", filter_addspend)
         if filter_revenue:
-            filtered_df = apply_condition(filtered_df, "Total Revenue (Rs.)", filter_revenue)
+            mask &= build_mask(agg_df["Total Revenue (Rs.)"].to_numpy(), "Total Revenue (Rs.)", filter_revenue)
 
+        # Sku Id shares one category set across df/agg_df, so SKU membership is tested on integer codes
+        sku_codes = agg_df["Sku Id"].cat.codes.to_numpy()
         if selected_skus:
-            filtered_df = filtered_df[filtered_df["Sku Id"].isin(selected_skus)]
+            selected_codes = agg_df["Sku Id"].cat.categories.get_indexer(selected_skus)
+            mask &= np.isin(sku_codes, selected_codes[selected_codes >= 0])
         if selected_date != "All" and "Date" in df.columns:
-            sku_with_date = df[df["Date"].astype(str) == selected_date]
-            sku_ids = sku_with_date["Sku Id"].unique()
-            filtered_df = filtered_df[filtered_df["Sku Id"].isin(sku_ids)]
+            # Compare on the native dtype so datetime columns skip the per-row str conversion
+            if pd.api.types.is_datetime64_any_dtype(df["Date"]):
+                sku_with_date = df[df["Date"] == pd.Timestamp(selected_date)]
+            else:
+                sku_with_date = df[df["Date"].astype(str) == selected_date]
+            mask &= np.isin(sku_codes, np.unique(sku_with_date["Sku Id"].cat.codes.to_numpy()))
+
+        filtered_df = agg_df.loc[mask]
 
         # Step 8: KPI Cards
-        total_clicks = filtered_df["Clicks"].sum()
-        total_views = filtered_df["Views"].sum()
-        total_direct = filtered_df["Direct Units Sold"].sum()
-        total_indirect = filtered_df["Indirect Units Sold"].sum()
+        kpi_block = filtered_df[["Clicks", "Views", "Direct Units Sold", "Indirect Units Sold"]].to_numpy()
+        total_clicks, total_views, total_direct, total_indirect = kpi_block.sum(axis=0)
 
         ctr_overall = (total_clicks / total_views) * 100 if total_views > 0 else 0
         cr_direct_adj = total_direct / (total_clicks - total_indirect) if (total_clicks - total_indirect) > 0 else 0
@@ -118,8 +215,12 @@ if uploaded_file:
         kpi4.metric("📈 Conversion Rate Direct Unit", f"{cr_direct_adj:.2%}")
 
         # Step 9: Format %
-        filtered_df["Conversion Rate per SKU"] = (filtered_df["Conversion Rate per SKU"] * 100).round(2)
-        filtered_df["Conversion Rate Direct Adjusted"] = (filtered_df["Conversion Rate Direct Adjusted"]).round(2)
+        # Scale into a fresh array and round it in place, then swap the columns in with assign
+        percent_columns = {}
+        for col in ["Conversion Rate per SKU", "Conversion Rate Direct Adjusted"]:
+            pct = filtered_df[col].to_numpy() * 100
+            percent_columns[col] = np.round(pct, 2, out=pct)
+        filtered_df = filtered_df.assign(**percent_columns)
 
         # Step 10: Table
         st.subheader("📋 Aggregated Campaign Table")
@@ -132,7 +233,7 @@ if uploaded_file:
 
         # Step 11: ROI Chart
         st.subheader("📊 Top 10 SKUs by ROI_Direct")
-        top_roi_df = filtered_df[filtered_df["Direct Units Sold"] > 0].sort_values(by="ROI_Direct", ascending=False).head(10)
+        top_roi_df = filtered_df.loc[filtered_df["Direct Units Sold"] > 0].nlargest(10, "ROI_Direct")
 
         if not top_roi_df.empty:
             fig = px.bar(
@@ -152,20 +253,20 @@ if uploaded_file:
 
         # Step 12: AddSpend vs Direct Revenue
         st.subheader("💸 AddSpend vs Direct Revenue (Top 10 by AddSpend)")
-        top_spend_df = filtered_df[filtered_df["Direct Units Sold"] > 0].sort_values(by="ADDSPEND", ascending=False).head(10)
+        top_spend_df = filtered_df.loc[filtered_df["Direct Units Sold"] > 0].nlargest(10, "ADDSPEND")
 
         if not top_spend_df.empty:
-            revenue_chart_df = top_spend_df[["Sku Id", "ADDSPEND", "Direct Revenue"]].melt(
-                id_vars="Sku Id", var_name="Metric", value_name="Amount"
-            )
-            fig2 = px.bar(
-                revenue_chart_df,
-                x="Sku Id",
-                y="Amount",
-                color="Metric",
+            fig2 = go.Figure([
+                go.Bar(name="ADDSPEND", x=top_spend_df["Sku Id"], y=top_spend_df["ADDSPEND"]),
+                go.Bar(name="Direct Revenue", x=top_spend_df["Sku Id"], y=top_spend_df["Direct Revenue"])
+            ])
+            fig2.update_traces(texttemplate="%{y}")
+            fig2.update_layout(
                 barmode="group",
                 title="AddSpend vs Direct Revenue per SKU",
-                text_auto=True
+                xaxis_title="Sku Id",
+                yaxis_title="Amount",
+                legend_title="Metric"
             )
             st.plotly_chart(fig2, use_container_width=True)
         else: